@@ -18,6 +18,9 @@ if __name__ == '__main__':
                         help="Password to lock source code with, 1-8 chars (default is no password.) "
                              "Setting a password only prevents you from looking at the source code on the calculator "
                              "and is not recommended, as it makes debugging on the calculator near impossible.")
+    parser.add_argument("-c", "--cache", dest="cache", action="store_true",
+                        help="Reuse the result of compiling an unchanged file from a previous run. "
+                             "Results are cached in " + compiler.CACHE_DIR)
     args = parser.parse_args()
     in_file = args.pyfile
     if not os.path.exists(in_file):
@@ -43,7 +46,7 @@ if __name__ == '__main__':
     if not args.out or not out.upper().endswith(".G1M"):
         out += ".G1M"
     print(f"Compiling {in_file}...")
-    context = compiler.compile_file(in_file)
+    context = compiler.compile_file(in_file, use_cache=args.cache)
     print(f"Casio code is {len(context.code)} lines")
     with open(out, 'wb') as f:
         count = f.write(context.export(name, password))
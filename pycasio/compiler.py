@@ -1,6 +1,13 @@
 import ast
+import hashlib
 import os.path
+import pickle
+import sys
+import tempfile
 import warnings
+from collections import namedtuple
+from dataclasses import dataclass
+from functools import cache, lru_cache
 from typing import Any
 from enum import IntFlag
 
@@ -11,14 +18,31 @@ from .context import CasioContext, CasioType, CompilerFlags
 
 
 def resolve_attr(attr: ast.Attribute) -> list[str]:
-    if isinstance(attr.value, ast.Attribute):
-        return resolve_attr(attr.value) + [attr.attr]
-    elif isinstance(attr.value, ast.Name):
-        return [attr.value.id, attr.attr]
-    print("UNKNOWN SUB-ATTRIBUTE", attr.value)
+    # walk down a.b.c collecting names from the outside in, then flip them
+    parts = [attr.attr]
+    node = attr.value
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        parts.reverse()
+        return parts
+    print("UNKNOWN SUB-ATTRIBUTE", node)
     return []
 
 
+# python's floating point max is around 1.7e308. casio's is this
+CASIO_MAX = 9.999999999e99
+
+
+def clamp_constants(root: ast.AST) -> None:
+    """ clamp every number literal in the tree to the range casio can represent """
+    for node in ast.walk(root):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            node.value = min(max(node.value, -CASIO_MAX), CASIO_MAX)
+
+
 def get_type(o):
     t = type(o)
     if t is float or t is int or t is complex:
@@ -28,12 +52,12 @@ def get_type(o):
     return CasioType.NULL
 
 
+# lightweight stand-in for an ast node when only the location is needed
+_Loc = namedtuple("_Loc", "lineno col_offset end_col_offset end_lineno")
+
+
 def node_between(left: SupportsAST, right: SupportsAST) -> SupportsAST:
-    sa = ast.AST()
-    sa.lineno = left.lineno
-    sa.col_offset = left.end_col_offset
-    sa.end_col_offset = right.col_offset
-    return sa
+    return _Loc(left.lineno, left.end_col_offset, right.col_offset, left.lineno)
 
 class CodeFlags(IntFlag):
     NONE = 0
@@ -65,6 +89,15 @@ class Code:
             self.flags |= CodeFlags.PREVENT_ASSIGNMENT | CodeFlags.PREVENT_ARGUMENT
 
 
+@dataclass(slots=True)
+class _CallState:
+    # the call being compiled and the last argument evaluated for it, for error reporting
+    node: ast.Call
+    func_name: str
+    last_arg: SupportsAST|None = None
+    last_code: Code|None = None
+
+
 class CasioNodeVisitor(ast.NodeVisitor):
     # some attributes do not directly translate to casio code
     # so the convention is as follows:
@@ -74,6 +107,17 @@ class CasioNodeVisitor(ast.NodeVisitor):
 
     def __init__(self, context: CasioContext):
         self.ctx = context
+        self._possible_modules = mh.get_pycasio_modules()
+        self._possible_functions = mh.get_pycasio_functions()
+        # node type -> bound visit_<NodeType>, so visit doesn't build a name and getattr it for every node
+        self._dispatch = {getattr(ast, name[6:]): getattr(self, name)
+                          for name in dir(self) if name.startswith("visit_") and hasattr(ast, name[6:])}
+
+    def visit(self, node: ast.AST) -> Any:
+        visitor = self._dispatch.get(type(node))
+        if visitor is None:
+            return self.generic_visit(node)
+        return visitor(node)
 
     def warning(self, w):
         if self.ctx.flags & CompilerFlags.IGNORE_WARNINGS:
@@ -91,25 +135,29 @@ class CasioNodeVisitor(ast.NodeVisitor):
         return node_eval
 
     def visit_Import(self, node: ast.Import) -> None:
-        POSSIBLE_MODULES = mh.get_pycasio_modules()
+        POSSIBLE_MODULES = self._possible_modules
+        prefix = f"{__package__}."
 
         # import pycasio, pycasio.casio, abc
         for name in node.names:
-            if name.name in POSSIBLE_MODULES:
+            if name.name != __package__ and not name.name.startswith(prefix):
+                continue  # import abc
+            mod = mh.intern_path(name.name)
+            if mod in POSSIBLE_MODULES:
                 # import pycasio, pycasio.casio
-                self.ctx.symbols.new(CasioType.NULL, name.asname or name.name, mh.ModulePath(name.name))
-            elif mh.PACKAGE.is_child(name.name):
+                self.ctx.symbols.new(CasioType.NULL, name.asname or name.name, mod)
+            else:
                 # import pycasio.invalid
                 raise CasioImportError(self.ctx, name,
                                            f"{name.name} is not a {__package__} module",
-                                           f"Possible modules: {list(sorted(str(x) for x in POSSIBLE_MODULES))}")
+                                           lambda: f"Possible modules: {list(mh.get_pycasio_modules_sorted())}")
 
     def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
-        POSSIBLE_MODULES = mh.get_pycasio_modules()
-        POSSIBLE_FUNCTIONS = mh.get_pycasio_functions()
+        POSSIBLE_MODULES = self._possible_modules
+        POSSIBLE_FUNCTIONS = self._possible_functions
 
         # could be literally any 'from' import
-        mod = mh.ModulePath(node.module)
+        mod = mh.intern_path(node.module)
         if mod not in mh.PACKAGE:
             return  # completely ignore other packages
 
@@ -117,7 +165,7 @@ class CasioNodeVisitor(ast.NodeVisitor):
         if mod not in POSSIBLE_MODULES:
             raise CasioImportError(self.ctx, node,
                                        f"{node.module} is not a valid {__package__} module",
-                                       f"Possible modules: {list(sorted(str(x) for x in POSSIBLE_MODULES))}")
+                                       lambda: f"Possible modules: {list(mh.get_pycasio_modules_sorted())}")
 
         # from pycasio import casio, invalid
         # from pycasio.casio import lib_name, invalid
@@ -131,10 +179,10 @@ class CasioNodeVisitor(ast.NodeVisitor):
                 if full_name not in POSSIBLE_MODULES:
                     # from pycasio import invalid
                     # from pycasio.casio import invalid
-                    children = mod.get_direct_children(POSSIBLE_MODULES)
+                    children = mh.get_direct_children_map().get(mod, ())
                     raise CasioImportError(self.ctx, name,
                                                f"{name.name} is not a valid {node.module} module",
-                                               f"Possible modules: {list(sorted(str(x) for x in children))}")
+                                               lambda: f"Possible modules: {sorted(children)}")
                 # from pycasio import casio
                 # from pycasio.casio import lib_name
             else:
@@ -145,7 +193,7 @@ class CasioNodeVisitor(ast.NodeVisitor):
                     # from pycasio.casio.lib_name import invalid
                     raise CasioImportError(self.ctx, name,
                                                f"{name.name} is not a valid {node.module} function",
-                                               f"Possible functions: {list(sorted(valid_func_names))}")
+                                               lambda: f"Possible functions: {sorted(valid_func_names)}")
                 # from pycasio.casio.lib_name import func_name
 
             self.ctx.symbols.new(CasioType.NULL, name.asname or name.name, full_name)
@@ -154,7 +202,9 @@ class CasioNodeVisitor(ast.NodeVisitor):
         # variable_name
         name = node.id
         if sym := self.ctx.symbols.get(name):
-            return Code(sym.var, sym.type)
+            if sym.cached_code is None:
+                sym.cached_code = Code(sym.var, sym.type)
+            return sym.cached_code
         else:
             raise CasioNameError(self.ctx, node,
                                  f"{name} is not defined")
@@ -199,62 +249,35 @@ class CasioNodeVisitor(ast.NodeVisitor):
         else:
             raise CasioNotImplementedException(self.ctx, node, "Dynamic function naming is not supported")
 
-        def check_args(count):
-            if len(node.args) > count:
-                raise CasioOperationError(self.ctx, node,
-                                          f"Too many arguments for {func_name} call, "
-                                          f"expected {count}, got {len(node.args)}")
-
-        last_arg: SupportsAST|None = None
-        last_code: Code|None = None
-
-        def check_type(expected):
-            if last_code.type != expected:
-                raise CasioTypeError(self.ctx, last_arg, f"{func_name} expects {expected}, not {last_code.type}")
-
-        def eval_arg(i) -> Code:
-            nonlocal last_arg, last_code
-            if len(node.args) <= i:
-                raise CasioOperationError(self.ctx, node,
-                                          f"Not enough arguments for {func_name} call, expected arg {i}")
-            arg = node.args[i]
-            last_arg = arg
-            last_code = self.check_eval(arg)
-            if last_code.type == CasioType.NULL:
-                raise CasioTypeError(self.ctx, arg, f"This expression does not return a value",
-                                     helptxt=last_code.flags.debug_msg())
-            if last_code.flags & CodeFlags.PREVENT_ARGUMENT:
-                raise CasioOperationError(self.ctx, arg, f"This expression cannot be used as an argument",
-                                          helptxt=last_code.flags.debug_msg())
-            return last_code
+        state = _CallState(node, func_name)
 
         # check supported built-in functions first, everything else is unsupported
         if func_name == "abs":
-            check_args(1)
-            n = eval_arg(0)
-            check_type(CasioType.NUMBER)
+            self._check_args(state, 1)
+            n = self._eval_arg(state, 0)
+            self._check_type(state, CasioType.NUMBER)
             return Code(B.ABSOLUTE + b"(" + n.bytes + b")", CasioType.NUMBER)
         elif func_name == "complex":
             raise CasioNotImplementedException(self.ctx, node, f"{func_name} not implemented yet")
         elif func_name == "input":
-            check_args(1)
+            self._check_args(state, 1)
             if len(node.args) == 0:
                 r = b"?"
             else:  # 1
-                s = eval_arg(0)
-                check_type(CasioType.STRING)
+                s = self._eval_arg(state, 0)
+                self._check_type(state, CasioType.STRING)
                 r = s.bytes + b"?"
             return Code(r, CasioType.STRING,
                         CodeFlags.PREVENT_ARGUMENT | CodeFlags.PREVENT_EXPRESSION | CodeFlags.HAS_SIDE_EFFECTS)
         elif func_name == "int":
-            check_args(1)
-            n = eval_arg(0)
-            check_type(CasioType.NUMBER)
+            self._check_args(state, 1)
+            n = self._eval_arg(state, 0)
+            self._check_type(state, CasioType.NUMBER)
             return Code(B.INT + b"(" + n + b")", CasioType.NUMBER)
         elif func_name == "bool":
-            check_args(1)
-            n = eval_arg(0)
-            check_type(CasioType.NUMBER)
+            self._check_args(state, 1)
+            n = self._eval_arg(state, 0)
+            self._check_type(state, CasioType.NUMBER)
             # python needs operands specifically turned into bools to do xor properly but not casio
             return Code(n.bytes, n.type, CodeFlags.IS_BOOLEAN)
         elif func_name == "len":
@@ -270,7 +293,7 @@ class CasioNodeVisitor(ast.NodeVisitor):
                 # skip empty prints
                 return Code(b"", CasioType.NULL, CodeFlags.HAS_SIDE_EFFECTS)
             elif len(node.args) == 1:
-                u = eval_arg(0)
+                u = self._eval_arg(state, 0)
                 return Code(u.bytes + B.DISP, CasioType.NULL, CodeFlags.HAS_SIDE_EFFECTS)
         elif func_name == "range":
             raise CasioNotImplementedException(self.ctx, node, f"{func_name} not implemented yet")
@@ -285,13 +308,38 @@ class CasioNodeVisitor(ast.NodeVisitor):
 
         # raise CasioNotImplementedException(self.ctx, node, "Call not supported yet")
 
+    def _check_args(self, state: _CallState, count: int) -> None:
+        if len(state.node.args) > count:
+            raise CasioOperationError(self.ctx, state.node,
+                                      f"Too many arguments for {state.func_name} call, "
+                                      f"expected {count}, got {len(state.node.args)}")
+
+    def _check_type(self, state: _CallState, expected: CasioType) -> None:
+        if state.last_code.type != expected:
+            raise CasioTypeError(self.ctx, state.last_arg,
+                                 f"{state.func_name} expects {expected}, not {state.last_code.type}")
+
+    def _eval_arg(self, state: _CallState, i: int) -> Code:
+        node = state.node
+        if len(node.args) <= i:
+            raise CasioOperationError(self.ctx, node,
+                                      f"Not enough arguments for {state.func_name} call, expected arg {i}")
+        arg = node.args[i]
+        state.last_arg = arg
+        state.last_code = self.check_eval(arg)
+        if state.last_code.type == CasioType.NULL:
+            raise CasioTypeError(self.ctx, arg, f"This expression does not return a value",
+                                 helptxt=state.last_code.flags.debug_msg())
+        if state.last_code.flags & CodeFlags.PREVENT_ARGUMENT:
+            raise CasioOperationError(self.ctx, arg, f"This expression cannot be used as an argument",
+                                      helptxt=state.last_code.flags.debug_msg())
+        return state.last_code
+
     def visit_Constant(self, node: ast.Constant) -> Code:
         if isinstance(node.value, str):
             return Code(b'"' + str(node.value).encode() + b'"', CasioType.STRING)
         elif isinstance(node.value, int) or isinstance(node.value, float):  # a number
-            # python's floating point max is around 1.7e308. casio's is this
-            CASIO_MAX = 9.999999999e99
-            node.value = min(max(node.value, -CASIO_MAX), CASIO_MAX)
+            # already clamped to the casio range by clamp_constants
             return Code(str(node.value).encode().replace(b"e", B.EXP), CasioType.NUMBER)
         else:
             raise CasioNotSupportedError(self.ctx, node, f"{type(node.value).__name__} type not supported")
@@ -410,45 +458,73 @@ class CasioNodeVisitor(ast.NodeVisitor):
         raise CasioNotSupportedError(self.ctx, node_between(node.values[0], node.values[1]),
                                      f"{op} boolean operation is not supported by Casio")
 
+    def _assign_code(self, name: str, right: ast.expr, right_eval: Code) -> None:
+        if right_eval.type == CasioType.NULL:
+            raise CasioTypeError(self.ctx, right, "This expression does not return a value",
+                                 helptxt=right_eval.flags.debug_msg())
+        if right_eval.flags & CodeFlags.PREVENT_ASSIGNMENT:
+            raise CasioOperationError(self.ctx, right, "This expression cannot be used in an assignment",
+                                      helptxt=right_eval.flags.debug_msg())
+        is_constant = isinstance(right, ast.Constant)
+        if is_constant and self.ctx.symbols.share_constant(right_eval.type, name, right_eval.bytes):
+            # this constant is already held by a var, which the symbol table keeps until all its holders are freed
+            return
+        sym = self.ctx.symbols.new(right_eval.type, name, right_eval.bytes)
+        # only add code if it makes sense
+        # it's allowed for the programmer to make assignments to things that aren't relevant to casio
+        # such as modules, or references to matrices
+        self.ctx.code.append(right_eval.bytes + B.ASSIGN + sym.var)
+        if is_constant:
+            self.ctx.symbols.hold_constant(sym)
+
+    def _assign_module(self, name: str, right: ast.expr, right_eval: mh.ModulePath) -> None:
+        self.ctx.symbols.new(CasioType.NULL, name, right_eval)
+
+    # assignment handler by the exact type of the evaluated right side
+    _ASSIGNERS = {
+        Code: _assign_code,
+        mh.ModulePath: _assign_module,
+    }
+
     def visit_Assign(self, node: ast.Assign) -> None:
         left = node.targets
         right = node.value  # type: ast.AST|ast.expr
         right_eval = self.visit(right)
+        assign = self._ASSIGNERS.get(type(right_eval))
         for left_sym in left:
-            if isinstance(left_sym, ast.Name):
-                if isinstance(right_eval, Code):
-                    if right_eval.type == CasioType.NULL:
-                        raise CasioTypeError(self.ctx, right, "This expression does not return a value",
-                                             helptxt=right_eval.flags.debug_msg())
-                    if right_eval.flags & CodeFlags.PREVENT_ASSIGNMENT:
-                        raise CasioOperationError(self.ctx, right, "This expression cannot be used in an assignment",
-                                                  helptxt=right_eval.flags.debug_msg())
-                    sym = self.ctx.symbols.new(right_eval.type, left_sym.id, right_eval.bytes)
-                    # only add code if it makes sense
-                    # it's allowed for the programmer to make assignments to things that aren't relevant to casio
-                    # such as modules, or references to matrices
-                    self.ctx.code.append(right_eval.bytes + B.ASSIGN + sym.var)
-                elif isinstance(right_eval, mh.ModulePath):
-                    self.ctx.symbols.new(CasioType.NULL, left_sym.id, right_eval)
-                else:
-                    raise CasioAssignmentError(self.ctx, right,
-                                               f"Can't assign to this expression "
-                                               f"(couldn't parse {right.__class__.__name__})")
-            else:
+            if not isinstance(left_sym, ast.Name):
                 raise CasioAssignmentError(self.ctx, left_sym, "Can't assign to this symbol")
+            if assign is None:
+                raise CasioAssignmentError(self.ctx, right,
+                                           f"Can't assign to this expression "
+                                           f"(couldn't parse {right.__class__.__name__})")
+            assign(self, left_sym.id, right, right_eval)
 
 
 DEBUG = False
 
 
-def compile_source(filename: str, src: str) -> CasioContext:
+def parse_source(src: str) -> ast.Module:
+    """
+    Parse source code into a tree ready to be compiled
+
+    :param src: source code to parse
+    """
+    node = ast.parse(src)
+    clamp_constants(node)
+    return node
+
+
+def compile_source(filename: str, src: str, node: ast.Module = None) -> CasioContext:
     """
     Compile source code using the filename as reference
 
     :param filename: name of file, used in exception output
     :param src: source code of said file
+    :param node: tree from parse_source(src), if it was already parsed
     """
-    node = ast.parse(src)
+    if node is None:
+        node = parse_source(src)
     if DEBUG:
         print(ast.dump(node, indent=2))
     context = CasioContext(filename, src, node)
@@ -457,12 +533,92 @@ def compile_source(filename: str, src: str) -> CasioContext:
     return context
 
 
-def compile_file(file: str) -> CasioContext:
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", __package__)
+
+
+@cache
+def _compiler_stamp() -> str:
+    # any edit to the compiler or the casio library invalidates previously cached results
+    # (but not the tests or their data, which can't change what a file compiles to)
+    pkg_dir = os.path.dirname(__file__)
+    stamps = []
+    for dir_path in (pkg_dir, os.path.join(pkg_dir, mh.CASIO_PACKAGE_NAME)):
+        for py in sorted(os.listdir(dir_path)):
+            if py.endswith(".py") and not py.startswith("test_"):
+                stamps.append(str(os.stat(os.path.join(dir_path, py)).st_mtime_ns))
+    return ",".join(stamps)
+
+
+# both keyed by the file's path, mtime and size so a changed file is read and parsed again
+@lru_cache(maxsize=128)
+def _read_source(path: str, mtime_ns: int, size: int) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+# the same tree is returned every time, callers must not mutate it
+@lru_cache(maxsize=128)
+def _parse_file(path: str, mtime_ns: int, size: int) -> ast.Module:
+    return parse_source(_read_source(path, mtime_ns, size))
+
+
+def compile_file(file: str, use_cache: bool = False) -> CasioContext:
     """
     Load and compile a file
 
+    With use_cache, compiled contexts are also cached in CACHE_DIR, keyed by the file's name and contents,
+    so compiling an unchanged file again skips the compiler. Warnings are stored with the cached result
+    and emitted again on every load.
+    Within one process, an unchanged file is never read or parsed twice either way.
+    Its tree is shared by every context compiled from it, so ``context.ast`` must not be mutated.
+
     :param file: path to file
+    :param use_cache: whether to read from and write to the cache
     """
-    with open(file) as f:
-        src = f.read()
-    return compile_source(os.path.basename(file), src)
+    st = os.stat(file)
+    src = _read_source(file, st.st_mtime_ns, st.st_size)
+    filename = os.path.basename(file)
+    if not use_cache or DEBUG:
+        # DEBUG needs the tree dump, which only happens when actually compiling
+        return compile_source(filename, src, _parse_file(file, st.st_mtime_ns, st.st_size))
+
+    # the context holds a pickled ast, which is only guaranteed to load in the same python
+    key = hashlib.blake2b(f"{sys.version}\0{_compiler_stamp()}\0{filename}\0{src}".encode()).hexdigest()
+    cache_file = os.path.join(CACHE_DIR, f"{key}.pkl")
+    try:
+        with open(cache_file, "rb") as f:
+            context, caught = pickle.load(f)
+    except FileNotFoundError:
+        pass  # not compiled yet
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+        warnings.warn(f"Ignoring unreadable cache entry {cache_file}: {e}")
+    else:
+        _rewarn(caught)
+        return context
+
+    # record the warnings so they can be stored with the context, then let them through as usual
+    with warnings.catch_warnings(record=True) as recorded:
+        warnings.simplefilter("always")
+        context = compile_source(filename, src, _parse_file(file, st.st_mtime_ns, st.st_size))
+    caught = [w.message for w in recorded]
+    _rewarn(caught)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # write it aside and move it into place, so a crash or another process never sees a partial entry
+        with tempfile.NamedTemporaryFile("wb", dir=CACHE_DIR, suffix=".tmp", delete=False) as f:
+            try:
+                pickle.dump((context, caught), f)
+            except Exception:
+                os.remove(f.name)
+                raise
+        os.replace(f.name, cache_file)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        warnings.warn(f"Could not cache {filename}: {e}")
+    except OSError:
+        pass  # caching is best effort
+    return context
+
+
+def _rewarn(caught: list[Warning]):
+    for message in caught:
+        warnings.warn(message)
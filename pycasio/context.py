@@ -3,7 +3,10 @@ import enum
 from . import module_helper as mh
 from .bytecode import Bytecode as B, Header
 import ast
+from collections import deque
 from enum import IntFlag
+from functools import cached_property, lru_cache
+from itertools import accumulate
 
 
 class CasioType(enum.Enum):
@@ -14,6 +17,8 @@ class CasioType(enum.Enum):
     # MATRIX = "mat"
 
 
+# keyed by paths from user code, so bounded like mh.intern_path
+@lru_cache(maxsize=1024)
 def get_casio_ref_type(ref: mh.ModulePath):
     # just a plain old module reference
     POSSIBLE_MODULES = mh.get_pycasio_modules()
@@ -23,32 +28,26 @@ def get_casio_ref_type(ref: mh.ModulePath):
     # must be a function reference
     # this must be a valid function module
     POSSIBLE_FUNCTIONS = mh.get_pycasio_functions()
-    lib = ref[:-1]
-    if lib not in POSSIBLE_FUNCTIONS:
+    lib, func = ref.split_last()
+    functions = POSSIBLE_FUNCTIONS.get(lib)
+    if functions is None:
         return None, ''
 
     # the function must exist inside its function module
-    functions = POSSIBLE_FUNCTIONS[lib]
-    func = ref[-1]
     if func not in functions:
-        return None
+        return None, ''
     return "func", (lib, func)
 
 
 class Symbol:
+    __slots__ = ("name", "value", "type", "var", "cached_code")
+
     def __init__(self, name: str, value, var_type: CasioType):
         self.name = name  # actual name in the program
         self.value = value  # no idea
         self.type = var_type
         self.var: bytes|None = None  # casio var symbol
-
-    def __hash__(self):
-        return hash(self.name)
-
-    def __eq__(self, other):
-        if isinstance(other, Symbol):
-            return self.name == other.name
-        return False
+        self.cached_code = None  # compiler's Code for reading this var, reset whenever var changes
 
     def __repr__(self):
         return f"Symbol{{{self.name} = {self.value} -> {self.var}}}"
@@ -57,18 +56,49 @@ class Symbol:
         return self.name
 
 
-class SymbolTable(dict):
+class SymbolTable:
+    """
+    Names in the program and the casio vars holding them
+
+    A var holding a constant may be shared by every symbol assigned that constant (see share_constant),
+    so vars are reference counted and only returned to the free pool once every symbol holding them
+    has been freed. The constant is forgotten at the same time, so a freed var is never shared.
+    """
+
     def __init__(self):
-        super().__init__()
+        self._syms: dict[str, Symbol] = {}
+        self._var_refs: dict[bytes, int] = {}  # casio var -> number of symbols holding it
+        # constant code -> casio var holding it, and back, so the same constant is only assigned once
+        self._constants: dict[bytes, bytes] = {}
+        self._var_constants: dict[bytes, bytes] = {}
         # X and Y are volatile because they get set automatically sometimes when doing graph operations
         # TODO: find out when and either avoid using those functions or report here that it's hopeless
         self.free_vars = {
-            CasioType.NUMBER: [B.THETA, B.RADIUS] + [x.encode() for x in "ZWVUTSRQPONMLKJIHGFEDCBA"],
-            CasioType.STRING: [B.STRING + str(x).encode() for x in range(1, 21)]
+            CasioType.NUMBER: deque([B.THETA, B.RADIUS] + [x.encode() for x in "ZWVUTSRQPONMLKJIHGFEDCBA"]),
+            CasioType.STRING: deque([B.STRING + str(x).encode() for x in range(1, 21)])
         }
+        self.version = 0  # bumped whenever a name is (re)bound
+
+    def get(self, name: str) -> Symbol | None:
+        return self._syms.get(name)
 
-    def get(self, __key: str) -> Symbol | None:
-        return super().get(__key)
+    def __getitem__(self, name: str) -> Symbol:
+        return self._syms[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._syms
+
+    def __iter__(self):
+        return iter(self._syms)
+
+    def __len__(self):
+        return len(self._syms)
+
+    def values(self):
+        return self._syms.values()
+
+    def __repr__(self):
+        return repr(self._syms)
 
     def new(self, var_type: CasioType, name: str, value) -> Symbol:
         sym = Symbol(name, value, var_type)
@@ -77,17 +107,44 @@ class SymbolTable(dict):
         self.add(sym)
         return sym
 
+    def hold_constant(self, sym: Symbol):
+        """ remember that the var of sym holds its constant value, for share_constant """
+        self._constants[sym.value] = sym.var
+        self._var_constants[sym.var] = sym.value
+
+    def share_constant(self, var_type: CasioType, name: str, value: bytes) -> Symbol | None:
+        """ make a new symbol reusing the var already holding this constant, if there is one """
+        var = self._constants.get(value)
+        if var is None:
+            return None
+        shared = Symbol(name, value, var_type)
+        shared.var = var
+        self._var_refs[var] += 1
+        self.add(shared)
+        return shared
+
     def add(self, sym: Symbol):
-        self[sym.name] = sym
+        self._syms[sym.name] = sym
+        self.version += 1
 
     def alloc(self, sym: Symbol):
         assert sym.var is None, "double alloc!"
         assert sym.type != CasioType.NULL
         sym.var = self.free_vars[sym.type].pop()
+        self._var_refs[sym.var] = 1
+        sym.cached_code = None
 
     def free(self, sym: Symbol):
         if sym.var is not None:
-            sym.var = self.free_vars[sym.type].append(sym.var)  # returns None
+            self._var_refs[sym.var] -= 1
+            if not self._var_refs[sym.var]:
+                # nothing else holds it, so it can be handed out again
+                del self._var_refs[sym.var]
+                if (value := self._var_constants.pop(sym.var, None)) is not None:
+                    del self._constants[value]
+                self.free_vars[sym.type].append(sym.var)
+            sym.var = None
+            sym.cached_code = None
 
 
 class CompilerFlags(IntFlag):
@@ -100,18 +157,32 @@ class CasioContext:
         self.filename = filename
         self.source = source
         self.ast = ast_root
-        self.symbols: SymbolTable[str, Symbol] = SymbolTable()
+        self.symbols = SymbolTable()
         self.code: list[bytes] = []
         self.flags = flags
+        # lookup_casio_ref results, only valid for the symbol table version they were computed at
+        self._ref_cache: dict[str, mh.ModulePath|None] = {}
+        self._ref_cache_version = self.symbols.version
+
+    @cached_property
+    def lines(self) -> list[str]:
+        return self.source.splitlines()
 
     def dump_ast(self):
         print(ast.dump(self.ast, indent=2))
 
-    def lookup_casio_ref(self, symbol: str):
-        mod = mh.ModulePath(symbol)
-        # find the first matching prefix
-        for i in range(len(mod)):
-            mod_alias = mod[:i+1]
+    def lookup_casio_ref(self, symbol: str) -> mh.ModulePath|None:
+        if self._ref_cache_version != self.symbols.version:
+            self._ref_cache.clear()
+            self._ref_cache_version = self.symbols.version
+        if symbol not in self._ref_cache:
+            self._ref_cache[symbol] = self._lookup_casio_ref(symbol)
+        return self._ref_cache[symbol]
+
+    def _lookup_casio_ref(self, symbol: str) -> mh.ModulePath|None:
+        mod = mh.intern_path(symbol)
+        # find the first matching prefix, building each dot path from the previous one
+        for i, mod_alias in enumerate(accumulate(symbol.split("."), lambda prefix, seg: f"{prefix}.{seg}")):
             if sym_ref := self.symbols.get(mod_alias):
                 full_ref = sym_ref.value
                 assert isinstance(full_ref, mh.ModulePath), f"symbol {symbol} = {full_ref} which is not a ModulePath"
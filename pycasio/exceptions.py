@@ -1,3 +1,4 @@
+import copyreg as _copyreg
 import typing as _typing
 from . import context as _context
 
@@ -11,8 +12,9 @@ class SupportsAST(_typing.Protocol):
 
 
 class CasioException(Exception):
-    def __init__(self, ctx: _context.CasioContext, lineinfo: SupportsAST, msg: str, helptxt: str = None):
-        lines = ctx.source.splitlines()
+    def __init__(self, ctx: _context.CasioContext, lineinfo: SupportsAST, msg: str,
+                 helptxt: str|_typing.Callable[[], str] = None):
+        lines = ctx.lines
         self.file = ctx.filename
         self.line = "<Invalid lineno>"
         self.lineno = 1
@@ -28,9 +30,30 @@ class CasioException(Exception):
                 else:
                     self.end_col_offset = len(self.line)
         self.msg = msg
-        self.helptxt = f"\nHelp:\n{helptxt}" if helptxt else ""
+        self._helptxt = helptxt
+        self._formatted: str|None = None
+
+    @property
+    def helptxt(self) -> str:
+        # help may be given as a callable so it's only built when the exception is actually shown
+        if callable(self._helptxt):
+            self._helptxt = self._helptxt()
+        return f"\nHelp:\n{self._helptxt}" if self._helptxt else ""
 
     def __str__(self):
+        # everything it's built from is fixed once raised, so only format it once
+        if self._formatted is None:
+            self._formatted = self._format()
+        return self._formatted
+
+    def __reduce__(self):
+        # the context, node and help callable it was built from can't all be pickled,
+        # but once formatted only the text is needed to show it again
+        str(self)
+        state = dict(self.__dict__, _helptxt=None)
+        return _copyreg.__newobj__, (type(self),), state
+
+    def _format(self) -> str:
         HEADER = f"{'=' * 20} CASIO COMPILER {'=' * 20}"
         linespan = ''
         if self.end_col_offset != -1:
@@ -1,8 +1,6 @@
-import importlib.util
-import inspect
-import pkgutil
-from functools import cache
-from typing import Iterable, Iterator
+import sys
+import types
+from functools import cache, lru_cache
 
 CASIO_PACKAGE_NAME = "casio"
 
@@ -28,17 +26,32 @@ class ModulePath:
 
         :param path: path of the module to hold
         """
-        self._path: list[str] = []
-        self._cstr = None
+        parts = []
         if isinstance(path, str):
-            self._path = path.split(".")
+            parts = path.split(".")
         elif isinstance(path, list):
             for m in path:
-                self._path.extend(m.split("."))
+                parts.extend(m.split("."))
+        self._set_path(tuple(sys.intern(m) for m in parts))
+
+    def _set_path(self, path: tuple[str, ...]):
+        # immutable, so the dot path and its hash only need to be computed once
+        self._path = path
+        self._cstr = ".".join(path)
+        self._hash = hash(path)
+
+    @staticmethod
+    def _from_tuple(path: tuple[str, ...]) -> 'ModulePath':
+        # segments are already split and interned, skip __init__
+        mod = ModulePath.__new__(ModulePath)
+        mod._set_path(path)
+        return mod
 
     @staticmethod
     def _norm(path: 'ModulePathType'):
-        if isinstance(path, str) or isinstance(path, list):
+        if isinstance(path, str):
+            return intern_path(path)
+        if isinstance(path, list):
             return ModulePath(path)
         return path
 
@@ -50,7 +63,7 @@ class ModulePath:
             return False
 
         # everything up to the child must be the same
-        return self[:-1] == child
+        return self._path == child._path[:-1]
 
     def is_child(self, child: 'ModulePathType'):
         child = ModulePath._norm(child)
@@ -60,88 +73,123 @@ class ModulePath:
             return False
 
         # everything in parent must exist in child
-        return self == child[:len(self)]
+        return self._path == child._path[:len(self._path)]
 
-    def get_direct_children(self, modules: Iterable['ModulePathType']) -> Iterator['ModulePath']:
-        for module in modules:
-            if self.is_direct_child(module):
-                yield module
+    def split_last(self) -> tuple['ModulePath', str]:
+        """
+        Split off the last name, like ``str.rpartition(".")`` without the separator
+
+        e.g. "a.b.c" -> ("a.b", "c")
+        """
+        return ModulePath._from_tuple(self._path[:-1]), self._path[-1]
 
     def __contains__(self, item):
         item = ModulePath._norm(item)
         if isinstance(item, ModulePath):
-            return self == item or self.is_child(item)
+            return self._path == item._path[:len(self._path)]
         return False
 
     def __len__(self):
         return len(self._path)
 
     def __lt__(self, other):
-        return str(self) < str(other)
+        if isinstance(other, ModulePath):
+            return self._path < other._path
+        return NotImplemented
 
     def __add__(self, other):
         # self + other
         other = ModulePath._norm(other)
         if isinstance(other, ModulePath):
-            return ModulePath(self._path + other._path)
+            return ModulePath._from_tuple(self._path + other._path)
         return NotImplemented
 
     def __radd__(self, other):
         # other + self
         other = ModulePath._norm(other)
         if isinstance(other, ModulePath):
-            return ModulePath(other._path + self._path)
+            return ModulePath._from_tuple(other._path + self._path)
         return NotImplemented
 
     def __getitem__(self, item):
         # self[1:5] or self[0]
-        # bypass nested checking for lists by setting path directly
-        return ModulePath(self._path[item])
+        if isinstance(item, slice):
+            return ModulePath._from_tuple(self._path[item])
+        return ModulePath._from_tuple((self._path[item],))
 
     def __str__(self):
-        if self._cstr is None:
-            self._cstr = ".".join(self._path)
         return self._cstr
 
     def __repr__(self):
         return f"ModulePath{{{self}}}"
 
     def __eq__(self, other):
-        return str(self) == str(other)
+        return self is other or (isinstance(other, ModulePath) and self._path == other._path)
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
+
+    def __reduce__(self):
+        # str hashes differ between processes, so rebuild the path (and its hash) instead of pickling _hash
+        return ModulePath._from_tuple, (self._path,)
 
 ModulePathType = str|list[str]|ModulePath
 
-PACKAGE: ModulePath = ModulePath(__package__)
+
+# paths come from user code too (any 'from x import', any attribute chain), so only keep the recent ones
+@lru_cache(maxsize=1024)
+def intern_path(path: str) -> ModulePath:
+    """
+    Get the shared ModulePath for a dot path.
+    Since ModulePath is immutable, equal paths can safely be the same object.
+    Only recently used paths are kept, so equal paths aren't guaranteed to be identical.
+
+    :param path: dot path of the module
+    """
+    return ModulePath(path)
+
+
+PACKAGE: ModulePath = intern_path(__package__)
 CASIO_LIB: ModulePath = PACKAGE + CASIO_PACKAGE_NAME
 
 
 @cache
 def get_pycasio_functions() -> dict[ModulePath, set[str]]:
-    casio_path = str(CASIO_LIB).replace(".", "/")
+    # only needed for discovery, so don't make importing this module pay for them
+    import importlib
+    import pkgutil
+
+    casio_package = importlib.import_module(str(CASIO_LIB))
     libs = {}
 
-    for _, mod_name, is_pkg in pkgutil.iter_modules([casio_path]):
+    for _, mod_name, is_pkg in pkgutil.iter_modules(casio_package.__path__):
         assert not is_pkg, "only 1-level deep packages implemented"
         full_lib = CASIO_LIB + mod_name
-        spec = importlib.util.find_spec(str(full_lib))
-        loaded_mod = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(loaded_mod)
+        loaded_mod = importlib.import_module(str(full_lib))
         libs[full_lib] = set()
-        for name, member in inspect.getmembers(loaded_mod):
+        for name, member in vars(loaded_mod).items():
             if name.startswith("_"):
                 continue
-            if inspect.isfunction(member) or inspect.isclass(member):
+            if isinstance(member, (types.FunctionType, type)):
                 libs[full_lib].add(name)
     return libs
 
 
 @cache
-def get_pycasio_modules() -> set[ModulePath]:
-    POSSIBLE_PACKAGES = {*get_pycasio_functions()}
-    POSSIBLE_PACKAGES.add(PACKAGE)
-    POSSIBLE_PACKAGES.add(CASIO_LIB)
-    return POSSIBLE_PACKAGES
+def get_pycasio_modules() -> frozenset[ModulePath]:
+    return frozenset({*get_pycasio_functions(), PACKAGE, CASIO_LIB})
 
+
+@cache
+def get_pycasio_modules_sorted() -> tuple[str, ...]:
+    # for help text only, membership checks should use get_pycasio_modules
+    return tuple(str(m) for m in sorted(get_pycasio_modules()))
+
+
+@cache
+def get_direct_children_map() -> dict[ModulePath, frozenset[str]]:
+    children = {}
+    for module in get_pycasio_modules():
+        if len(module) > 1:
+            children.setdefault(module[:-1], set()).add(module._path[-1])
+    return {parent: frozenset(names) for parent, names in children.items()}
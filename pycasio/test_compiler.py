@@ -1,8 +1,9 @@
-import inspect
+import bisect
+import mmap
 import os
 import re
 import sys
-from functools import cache
+from functools import cached_property, partialmethod
 from unittest import TestCase
 
 from . import compiler
@@ -13,73 +14,113 @@ from .bytecode import Bytecode
 
 
 class TestCompiler(TestCase):
-    pass
+    def shortDescription(self):
+        # the generated tests are partials, whose docstring is functools.partial's own
+        return None
 
 
-FIND_TEST_PATTERN = re.compile(r"^[ \t]*#.*@test[ \t]+([a-z0-9_-]+)[ \t]?(.*)", re.IGNORECASE)
-FIND_BYTE_REPL = re.compile(r"\{([A-Z_]+)}")  # TODO: allow {,} escape
+# bytes pattern, run straight over the mmapped test file
+FIND_TEST_PATTERN = re.compile(rb"^[ \t]*#.*@test[ \t]+([a-z0-9_-]+)[ \t]?([^\n]*)", re.IGNORECASE | re.MULTILINE)
+FIND_BYTE_REPL = re.compile(rb"\{([A-Z_]+)}")  # TODO: allow {,} escape
+_MISSING = object()
+_BYTECODE_TABLE: dict[str, bytes] = {n: v for n, v in vars(Bytecode).items() if isinstance(v, bytes)}
+
+# directive name -> TestLoader method, filled in by @register_test as the class body runs
+_TEST_REGISTRY: dict[str, callable] = {}
+
+
+def register_test(fn):
+    name = fn.__name__[5:]  # remove test_
+    # directives may spell it either way (symbol_num or symbol-num), so no need to normalize them
+    _TEST_REGISTRY[name] = fn
+    _TEST_REGISTRY[name.replace("_", "-")] = fn
+    return fn
 
 
 class TestLoader:
     def __init__(self, path: str):
         self.path = path
         self.filename = os.path.basename(path)
-        with open(path) as f:
-            self.source = f.read()
         self.tester: TestCase|None = None
         self.line_no = 0
-        self.lines = self.source.splitlines()
-
-    def generate_tests(self, cls: type):
+        self._compiled = _MISSING  # (context, exception, its traceback) from the first compile
+        self.directives: list[tuple[callable, tuple, int]] = []  # (test method, parsed arguments, line number)
+
+    @cached_property
+    def source(self) -> str:
+        # only decoded once something actually compiles the file
+        # read exactly the file's size in one go instead of growing a buffer
+        size = os.stat(self.path).st_size
+        with open(self.path, "rb") as f:
+            return f.read(size).decode("utf-8")
+
+    @cached_property
+    def lines(self) -> list[str]:
+        # only needed to show the directive line when a tester error happens
+        return self.source.splitlines()
+
+    def scan_directives(self) -> list[tuple[int, str, str]]:
+        """ find every @test directive in the file as (line number, test name, unsplit arguments) """
+        directives = []
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return directives  # empty files can't be mapped
+            # let the regex scan the page cache directly, only the captured groups are copied and decoded
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # every directive has an @ and most files have none, so skip the regex for those
+                # (only the @ is checked since the pattern ignores case in "test")
+                if mm.find(b"@") == -1:
+                    return directives
+                # offset of every newline, to find the line number of a match
+                newlines = []
+                i = mm.find(b"\n")
+                while i != -1:
+                    newlines.append(i)
+                    i = mm.find(b"\n", i + 1)
+                for match in FIND_TEST_PATTERN.finditer(mm):
+                    line_num = bisect.bisect_left(newlines, match.start()) + 1
+                    # the pattern ignores case, so the name may too
+                    method_name = match.group(1).decode("ascii").lower()
+                    # TODO: allow spaces in arguments when enclosed in "
+                    #       like ``@test symbol var "hello world"`` would not work properly
+                    args_str = match.group(2).decode("utf-8")  # split and parsed once the test is registered
+                    directives.append((line_num, method_name, args_str))
+        return directives
+
+    def generate_tests(self, cls: type, directives: list[tuple[int, str, str]]):
         test_map = get_test_map()
 
-        test_count = 0
-        for line_num, line in enumerate(self.lines, start=1):
-            match = FIND_TEST_PATTERN.match(line)
-            if not match:
-                continue
-
-            method_name = match.group(1)
-            # TODO: allow spaces in arguments when enclosed in "
-            #       like ``@test symbol var "hello world"`` would not work properly
-            args = match.group(2).strip().split()
-            method_name = method_name.replace("-", "_")
+        for line_num, method_name, args_str in directives:
             if method_name not in test_map:
                 print(f"[Test Loader] Unknown test '{method_name}' in {self.filename}", file=sys.stderr)
                 continue
+            # arguments never change, so parse them here rather than every time the test runs
+            vargs = tuple(parse_value(v) for v in args_str.split())
+            self.directives.append((test_map[method_name], vargs, line_num))
+        if not self.directives:
+            return 0
 
-            test_method = test_map[method_name]
-
-            # intermediate values for the function capture
-            this_line_num = line_num
-            this_line = line
-
-            def some_func(tester_self):
-                # called as if this function is a member in the tester class (TestCompiler->self == tester_self)
-                self.tester = tester_self
-                self.line_no = this_line_num
-                vargs = [parse_value(v) for v in args]
-                try:
-                    test_method(self, *vargs)  # some method in TestLoader beginning with "test_"
-                except TypeError as e:
-                    print(f"[Test Loader] TESTER ERROR:{self.msg()}", file=sys.stderr)
-                    print(this_line, file=sys.stderr)
-                    print(f"Method name: test_{method_name}, Args parsed: {vargs}", file=sys.stderr)
-                    raise e
-
-            # this is basically taken from https://stackoverflow.com/a/2799009
-            # update class of interest with new test method
-            some_func.__name__ = f"test_{self.filename}"
-            setattr(cls, some_func.__name__, some_func)
-            test_count += 1
-        return test_count
+        # update class of interest with new test method, bound to this loader without a closure
+        setattr(cls, f"test_{self.filename}", partialmethod(_run_directives, self))
+        return len(self.directives)
 
     def msg(self):
         return f"\nTest File \"{self.path}\", line {self.line_no}"
 
     def compile(self):
-        return compiler.compile_source(self.filename, self.source)
-
+        # every directive in a file compiles the same source, so only do it once and replay the outcome
+        if self._compiled is _MISSING:
+            try:
+                self._compiled = (compiler.compile_source(self.filename, self.source), None, None)
+            except Exception as e:
+                self._compiled = (None, e, e.__traceback__)
+        context, error, tb = self._compiled
+        if error is not None:
+            # every raise adds to the traceback, so start from the original one each time
+            raise error.with_traceback(tb)
+        return context
+
+    @register_test
     def test_compiles(self):
         """ test that the file compiles and return the context if it does """
         try:
@@ -90,6 +131,7 @@ class TestLoader:
             self.tester.fail(f"Test expected file to compile: {self.msg()}")
             raise e
 
+    @register_test
     def test_err(self, ename):
         """ test that a certain error occured while compiling the file """
         if ename[0].islower():
@@ -105,13 +147,14 @@ class TestLoader:
         with self.tester.assertRaises(ex, msg=self.msg()):
             self.compile()
 
+    @register_test
     def test_import(self, name, module_path):
         """ test that a certain symbol contains the module path """
         context = self.test_compiles()
         self.tester.assertIn(name, context.symbols, self.msg())
         import_sym = context.symbols[name].value
         self.tester.assertIsInstance(import_sym, mh.ModulePath, self.msg())
-        self.tester.assertEqual(import_sym, module_path, self.msg())
+        self.tester.assertEqual(import_sym, mh.intern_path(module_path), self.msg())
 
     def _test_symbol(self, type_: CasioType, bytes_: bytes, name):
         context = self.test_compiles()
@@ -120,75 +163,123 @@ class TestLoader:
         self.tester.assertEqual(type_, sym.type, self.msg())
         self.tester.assertEqual(bytes_, sym.value, self.msg())
 
+    @register_test
+    def test_symbol_shared(self, name, other):
+        """ test that two symbols are held by the same casio var """
+        context = self.test_compiles()
+        self.tester.assertIn(name, context.symbols, self.msg())
+        self.tester.assertIn(other, context.symbols, self.msg())
+        self.tester.assertIsNotNone(context.symbols[name].var, self.msg())
+        self.tester.assertEqual(context.symbols[name].var, context.symbols[other].var, self.msg())
+
+    @register_test
     def test_symbol_str(self, name, value):
         """ test that a symbol contains a string value """
         self._test_symbol(CasioType.STRING, b'"' + str(value).encode() + b'"', name)
 
+    @register_test
     def test_symbol_num(self, name, value):
         """ test that a symbol contains a number value """
         self._test_symbol(CasioType.NUMBER, str(value).encode(), name)
 
+    @register_test
     def test_symbol_expr(self, name, value):
         """ test that a symbol contains a number with specific bytecode """
-        new_value = str(value).encode()
-        for byte_repl in FIND_BYTE_REPL.finditer(value):
-            match = byte_repl.group(0)
-            text = byte_repl.group(1)
-            if not hasattr(Bytecode, text):
+        raw = str(value).encode()
+        if b"{" not in raw:
+            # most expressions are plain numbers, don't start the regex engine for those
+            self._test_symbol(CasioType.NUMBER, raw, name)
+            return
+        # build the expected bytes from the pieces between placeholders in a single pass
+        parts = []
+        end = 0
+        for byte_repl in FIND_BYTE_REPL.finditer(raw):
+            text = byte_repl.group(1).decode()
+            casio_bytes = _BYTECODE_TABLE.get(text)
+            if casio_bytes is None:
                 self.tester.fail(f"{self.msg()}\n{text} bytecode does not exist")
                 return
-            casio_bytes = getattr(Bytecode, text)
-            if not isinstance(casio_bytes, bytes):
-                self.tester.fail(f"{self.msg()}\n{text} is not valid bytecode")
-                return
-            new_value = new_value.replace(match.encode(), casio_bytes, 1)
+            parts.append(raw[end:byte_repl.start()])
+            parts.append(casio_bytes)
+            end = byte_repl.end()
+        parts.append(raw[end:])
+        new_value = b"".join(parts)
 
         self._test_symbol(CasioType.NUMBER, new_value, name)
 
-@cache
+def _run_directive(tester_self: TestCase, loader: TestLoader, test_method: callable, vargs: tuple, line_num: int):
+    # called as if this function is a member in the tester class (TestCompiler->self == tester_self)
+    loader.tester = tester_self
+    loader.line_no = line_num
+    try:
+        test_method(loader, *vargs)  # some method in TestLoader beginning with "test_"
+    except TypeError as e:
+        print(f"[Test Loader] TESTER ERROR:{loader.msg()}", file=sys.stderr)
+        print(loader.lines[line_num - 1], file=sys.stderr)
+        print(f"Method name: {test_method.__name__}, Args parsed: {vargs}", file=sys.stderr)
+        raise e
+
+
+def _run_directives(tester_self: TestCase, loader: TestLoader):
+    """ run every directive in a test file """
+    # one test per file, each directive is reported as its own subtest
+    for test_method, vargs, line_num in loader.directives:
+        with tester_self.subTest(line=line_num):
+            _run_directive(tester_self, loader, test_method, vargs, line_num)
+
+
 def get_test_map() -> dict[str, callable]:
-    d = {}
-    for name, member in inspect.getmembers(TestLoader):
-        if inspect.isfunction(member) and name.startswith("test_"):
-            d[name[5:]] = member  # remove test_
-    return d
+    return _TEST_REGISTRY
 
 
 def parse_value(v: str):
-    try:
-        return int(v)
-    except ValueError:
-        pass
-    try:
-        return float(v)
-    except ValueError:
-        pass
+    # decide by the first character so plain strings never go through a failed int() and float()
+    c = v[0]
+    if c == '"':
+        # always remove quotes
+        return v[1:-1] if v[-1] == '"' else v
+    if c.isdigit() or c in "+-.":
+        try:
+            return int(v)
+        except ValueError:
+            pass
+        try:
+            return float(v)
+        except ValueError:
+            pass
     # else str
-    # always remove quotes
-    if v[0] == '"' and v[-1] == '"':
-        return v[1:-1]
     return v
 
 
+def _iter_py(root: str):
+    # the dir entries already know their type, so nothing here needs an extra stat
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_py(entry.path)
+            elif entry.is_dir():
+                # like os.walk, don't descend into linked directories
+                print(f"[Test Loader] Skipping symlinked directory '{entry.name}'")
+            elif entry.name.endswith(".py") and entry.is_file():
+                yield entry.path  # linked files are loaded like any other
+            else:
+                print(f"[Test Loader] Skipping non-py file '{entry.name}'")
+
+
 def load_compiler_tests():
     file_count = 0
     test_count = 0
     parent_dir = os.path.dirname(__file__)
     test_dir = os.path.join(parent_dir, "test_data")
-    for dir_path, dir_names, file_names in os.walk(test_dir):
-        for test_py in file_names:
-            if not test_py.endswith(".py"):
-                print(f"[Test Loader] Skipping non-py file '{test_py}'")
-                continue
-
-            test_file = os.path.join(dir_path, test_py)
-            tester = TestLoader(test_file)  # cut off .py
-            tests_generated = tester.generate_tests(TestCompiler)
-            if tests_generated == 0:
-                print(f"[Test Loader] No tests found in file {test_py}", file=sys.stderr)  # TODO: use logging
-            else:
-                file_count += 1
-                test_count += tests_generated
+    for test_file in _iter_py(test_dir):
+        tester = TestLoader(test_file)
+        tests_generated = tester.generate_tests(TestCompiler, tester.scan_directives())
+        if tests_generated == 0:
+            # TODO: use logging
+            print(f"[Test Loader] No tests found in file {tester.filename}", file=sys.stderr)
+        else:
+            file_count += 1
+            test_count += tests_generated
 
     print(f"[Test Loader] Loaded {test_count} tests from {file_count} files")
 
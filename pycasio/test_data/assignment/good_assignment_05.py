@@ -1,6 +1,6 @@
-# @test symbol-num bb -4
+# @test symbol-expr b {NEGATIVE}4
 b = -4
-# @test symbol-num bb -4.5
+# @test symbol-expr bb {NEGATIVE}4.5
 bb = -4.5
 # @test symbol-num bbb 4
 bbb = +4
@@ -1,6 +1,6 @@
 # @test symbol-num a1 2.0
 a1 = 2.0
-# @test symbol-num a2 -1.2345
+# @test symbol-expr a2 {NEGATIVE}1.2345
 a2 = -1.2345
 # @test symbol-str a3 "23.5Mbps"
 a3 = "23.5Mbps"
\ No newline at end of file
@@ -0,0 +1,5 @@
+# @test symbol-num x 7
+x = 7
+# @test symbol-num y 7
+# @test symbol-shared x y
+y = 7